@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+"""Stand-in for the Minecraft server, for benchmarking minecraft.py without Java.
+
+It reads commands from stdin and writes log lines in the format of a vanilla server to stdout and logs/latest.log in the working directory, rotating an existing latest.log on startup like the real server does. All command line arguments (the JVM options passed by minecraft.start) are ignored. Instead, it is configured using these environment variables:
+
+FAKE_MINECRAFT_EVENTS -- If set, a JSON object with a precise timestamp is appended to this file for each lifecycle event (done, save_off, save_on, saved, stopping), so downtimes can be measured more precisely than the log timestamps allow.
+FAKE_MINECRAFT_PLAYERS -- A comma-separated list of players who join right after startup. Defaults to no players.
+FAKE_MINECRAFT_SAVE_TIME -- How long save-all and saving during shutdown take, in seconds. Defaults to 0.5.
+FAKE_MINECRAFT_STARTUP_TIME -- How long it takes until the server is done starting, in seconds. Defaults to 1.
+"""
+
+import datetime
+import gzip
+import json
+import os
+import os.path
+import shutil
+import sys
+import time
+
+EVENTS_FILE = os.environ.get('FAKE_MINECRAFT_EVENTS')
+PLAYERS = [player for player in os.environ.get('FAKE_MINECRAFT_PLAYERS', '').split(',') if player]
+SAVE_TIME = float(os.environ.get('FAKE_MINECRAFT_SAVE_TIME', 0.5))
+STARTUP_TIME = float(os.environ.get('FAKE_MINECRAFT_STARTUP_TIME', 1))
+
+def event(name):
+    if EVENTS_FILE is not None:
+        with open(EVENTS_FILE, 'a') as events:
+            print(json.dumps({'event': name, 'pid': os.getpid(), 'time': time.time()}), file=events)
+
+def rotate_logs():
+    # compress the previous latest.log to logs/YYYY-MM-DD-N.log.gz
+    os.makedirs('logs', exist_ok=True)
+    latest = os.path.join('logs', 'latest.log')
+    if not os.path.exists(latest):
+        return
+    date = datetime.date.fromtimestamp(os.path.getmtime(latest)).strftime('%Y-%m-%d')
+    n = 1
+    while os.path.exists(os.path.join('logs', '{}-{}.log.gz'.format(date, n))):
+        n += 1
+    archive = os.path.join('logs', '{}-{}.log'.format(date, n))
+    os.rename(latest, archive)
+    with open(archive, 'rb') as source, gzip.open(archive + '.gz', 'wb') as target:
+        shutil.copyfileobj(source, target)
+    os.remove(archive)
+
+def main():
+    rotate_logs()
+    started = time.monotonic()
+    with open(os.path.join('logs', 'latest.log'), 'a') as logfile:
+        def log(message, thread='Server thread', level='INFO'):
+            line = '[{}] [{}/{}]: {}'.format(datetime.datetime.now().strftime('%H:%M:%S'), thread, level, message)
+            print(line, file=logfile, flush=True)
+            print(line, flush=True)
+
+        def save():
+            log('Saving...')
+            time.sleep(SAVE_TIME)
+            log('Saved the world')
+            event('saved')
+
+        log('Starting minecraft server version fake')
+        log('Preparing level "world"')
+        time.sleep(STARTUP_TIME)
+        log('Done ({:.3f}s)! For help, type "help" or "?"'.format(time.monotonic() - started))
+        event('done')
+        for player in PLAYERS:
+            log(player + ' joined the game')
+        for line in sys.stdin:
+            cmd, _, args = line.strip().partition(' ')
+            if cmd == 'list':
+                log('There are {}/20 players online:'.format(len(PLAYERS)))
+                log(', '.join(PLAYERS))
+            elif cmd == 'say':
+                log('[Server] ' + args)
+            elif cmd == 'tellraw':
+                log(args)
+            elif cmd == 'save-off':
+                log('Turned off world auto-saving')
+                event('save_off')
+            elif cmd == 'save-on':
+                log('Turned on world auto-saving')
+                event('save_on')
+            elif cmd == 'save-all':
+                save()
+            elif cmd == 'stop':
+                break
+            elif cmd == 'whitelist':
+                log('Reloaded the whitelist' if args == 'reload' else 'Added ' + args.partition(' ')[2] + ' to the whitelist')
+            else:
+                log('Unknown command. Try /help for a list of commands')
+        log('Stopping server')
+        event('stopping')
+        for player in PLAYERS:
+            log(player + ' left the game')
+        log('Saving worlds')
+        time.sleep(SAVE_TIME)
+
+if __name__ == '__main__':
+    main()
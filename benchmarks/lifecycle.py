@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+"""End-to-end benchmarks for minecraft.py, run against the fake server from fake_server.py.
+
+A temporary server directory with a generated world is set up, and a java executable which runs the fake server is put first on the PATH, so minecraft.start runs the fake server instead of Java.
+
+Usage:
+  lifecycle [options]
+  lifecycle -h | --help
+
+Options:
+  -h, --help                Print this message and exit.
+  --compare=<results>       Print the change relative to the results in this JSON file, e.g. from an earlier commit.
+  --output=<path>           Where to store the results as JSON. Defaults to benchmarks/results/<commit>.json.
+  --rounds=<n>              How often to repeat the import, status and command measurements [default: 20].
+  --save-time=<seconds>     How long the fake server takes to save the world [default: 0.5].
+  --startup-time=<seconds>  How long the fake server takes to start [default: 1].
+  --world-size=<mib>        Size of the generated world directory in MiB [default: 256].
+"""
+
+import sys
+
+import datetime
+from docopt import docopt
+import getpass
+import json
+import os
+import os.path
+import platform
+import signal
+import statistics
+import subprocess
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import minecraft
+
+def _quiet(message):
+    pass
+
+def cleanup():
+    """Kill the fake server and the helper processes forked by minecraft.start, without going through the command socket, which may be what failed. Only processes of this benchmark run are affected."""
+    paths = minecraft.config('paths')
+    # the helpers are recognized by the files of this run they have open: the command socket and the pipes to the fake server
+    run_files = set()
+    with open('/proc/net/unix') as unix_sockets:
+        for line in unix_sockets:
+            fields = line.split()
+            if len(fields) >= 8 and fields[7] == paths['socket']:
+                run_files.add('socket:[{}]'.format(fields[6]))
+    try:
+        with open(paths['pidfile']) as pidfile:
+            server_pid = int(pidfile.read().strip())
+        for fd in (0, 1): # stdin and stdout
+            run_files.add(os.readlink('/proc/{}/fd/{}'.format(server_pid, fd)))
+        os.kill(server_pid, signal.SIGKILL)
+    except (IOError, OSError, ValueError):
+        pass
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit() or int(pid) == os.getpid():
+            continue
+        try:
+            fd_dir = os.path.join('/proc', pid, 'fd')
+            if not any(os.readlink(os.path.join(fd_dir, fd)) in run_files for fd in os.listdir(fd_dir)):
+                continue
+            pgid = os.getpgid(int(pid))
+            if pgid != os.getpgrp():
+                os.killpg(pgid, signal.SIGKILL)
+        except (IOError, OSError):
+            pass
+
+def compare(results, old_results, prefix=''):
+    """Print each result next to the one from an earlier run."""
+    for key, value in sorted(results.items()):
+        old_value = old_results.get(key)
+        if isinstance(value, dict):
+            compare(value, old_value if isinstance(old_value, dict) else {}, prefix=prefix + key + '.')
+        elif isinstance(old_value, (int, float)) and old_value:
+            print('{}{}: {:.4f} -> {:.4f} ({:+.1f}%)'.format(prefix, key, old_value, value, (value - old_value) / old_value * 100))
+        else:
+            print('{}{}: {:.4f}'.format(prefix, key, value))
+
+def events(events_file, name, after=0):
+    """Return the times of the fake server's lifecycle events with the given name, see fake_server.py."""
+    try:
+        with open(events_file) as f:
+            return [event['time'] for event in map(json.loads, f) if event['event'] == name and event['time'] >= after]
+    except FileNotFoundError:
+        return []
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO).decode('utf-8').strip('\n')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def run(config_path, events_file, rounds=20, world_size=256):
+    """Run all benchmarks against the fake server and return the results as a dict. Times are in seconds."""
+    results = {}
+    # startup cost of the init script, see python -X importtime
+    import_times = []
+    for _ in range(rounds):
+        importtime = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import minecraft'], cwd=REPO, stderr=subprocess.PIPE, check=True).stderr.decode('utf-8')
+        for line in importtime.splitlines():
+            _, cumulative, name = line.split('|')
+            if name.strip() == 'minecraft':
+                import_times.append(int(cumulative.strip()) / 1000000)
+    results['import'] = summary(import_times)
+    results['status_cli'] = summary([timed(subprocess.call, [sys.executable, os.path.join(REPO, 'minecraft.py'), '--config=' + config_path, 'status'], stdout=subprocess.DEVNULL) for _ in range(rounds)])
+    # lifecycle
+    results['start'] = timed(minecraft.start, reply=_quiet)
+    if not minecraft.status():
+        raise RuntimeError('the fake server did not start')
+    results['command_round_trip'] = summary([timed(minecraft.command, 'list') for _ in range(rounds)])
+    results['online_players'] = summary([timed(minecraft.online_players) for _ in range(rounds)])
+    backup_started = time.time()
+    progress = {}
+    results['backup'] = timed(minecraft.backup, reply=lambda message: progress.setdefault(message, time.perf_counter()))
+    results['backup_read_only'] = events(events_file, 'save_on', after=backup_started)[0] - events(events_file, 'save_off', after=backup_started)[0]
+    # the progress messages separate copying the world (tar and rsync) and compressing it from the fixed waits for saving
+    results['backup_copy'] = progress['Minecraft is running... re-enabling saves'] - progress['Backing up minecraft world...']
+    results['backup_compress'] = progress['Symlinking to httpdocs...'] - progress['Compressing backup...']
+    results['backup_throughput_mib_per_second'] = world_size / (results['backup_copy'] + results['backup_compress'])
+    restart_started = time.time()
+    results['restart'] = timed(minecraft.restart, reply=_quiet)
+    results['restart_downtime'] = events(events_file, 'done', after=restart_started)[0] - events(events_file, 'stopping', after=restart_started)[0]
+    results['stop'] = timed(minecraft.stop, reply=_quiet)
+    return results
+
+def setup(base_dir, world_size=256):
+    """Create a server directory with a world of the given size in MiB and a config file for it, and put the fake java on the PATH. Returns the path to the config file."""
+    server_dir = os.path.join(base_dir, 'server')
+    region_dir = os.path.join(server_dir, 'world', 'region')
+    os.makedirs(region_dir)
+    os.makedirs(os.path.join(base_dir, 'backup'))
+    os.makedirs(os.path.join(base_dir, 'log'))
+    for i in range(world_size):
+        with open(os.path.join(region_dir, 'r.{}.0.mca'.format(i)), 'wb') as region_file:
+            region_file.write(os.urandom(1024 * 1024))
+    bin_dir = os.path.join(base_dir, 'bin')
+    os.makedirs(bin_dir)
+    with open(os.path.join(bin_dir, 'java'), 'w') as java:
+        print('#!/bin/sh', file=java)
+        print('exec {} {} "$@"'.format(sys.executable, os.path.join(REPO, 'benchmarks', 'fake_server.py')), file=java)
+    os.chmod(os.path.join(bin_dir, 'java'), 0o755)
+    os.environ['PATH'] = bin_dir + os.pathsep + os.environ.get('PATH', '')
+    config_path = os.path.join(base_dir, 'init-minecraft.json')
+    with open(config_path, 'w') as config_file:
+        json.dump({
+            'paths': {
+                'backup': os.path.join(base_dir, 'backup'),
+                'backupweb': os.path.join(base_dir, 'latestbackup.tar.gz'),
+                'log': os.path.join(base_dir, 'log'),
+                'logConfig': 'log4j2.xml',
+                'server': server_dir,
+                'service': os.path.join(server_dir, 'fake_minecraft_server.jar'),
+                'socket': os.path.join(base_dir, 'commands.sock')
+            },
+            'service_name': os.path.join(server_dir, 'fake_minecraft_server.jar'), # the full path, so concurrent runs don't see each other's servers
+            'username': getpass.getuser(),
+            'world': 'world'
+        }, config_file, sort_keys=True, indent=4, separators=(',', ': '))
+    return config_path
+
+def summary(timings):
+    timings = sorted(timings)
+    return {
+        'median': statistics.median(timings),
+        'p95': timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    }
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+    rounds = int(arguments['--rounds'])
+    world_size = int(arguments['--world-size'])
+    commit = git_commit()
+    with tempfile.TemporaryDirectory(prefix='minecraft-bench-') as base_dir:
+        minecraft.CONFIG_FILE = setup(base_dir, world_size=world_size)
+        events_file = os.path.join(base_dir, 'events.jsonl')
+        os.environ['FAKE_MINECRAFT_EVENTS'] = events_file
+        os.environ['FAKE_MINECRAFT_PLAYERS'] = 'alice,bob'
+        os.environ['FAKE_MINECRAFT_SAVE_TIME'] = arguments['--save-time']
+        os.environ['FAKE_MINECRAFT_STARTUP_TIME'] = arguments['--startup-time']
+        try:
+            results = run(minecraft.CONFIG_FILE, events_file, rounds=rounds, world_size=world_size)
+        finally:
+            cleanup()
+    output = arguments['--output'] or os.path.join(REPO, 'benchmarks', 'results', commit + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as output_file:
+        json.dump({
+            'commit': commit,
+            'parameters': {
+                'rounds': rounds,
+                'save_time': float(arguments['--save-time']),
+                'startup_time': float(arguments['--startup-time']),
+                'world_size': world_size
+            },
+            'python': platform.python_version(),
+            'results': results,
+            'timestamp': datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        }, output_file, sort_keys=True, indent=4, separators=(',', ': '))
+    if arguments['--compare']:
+        with open(arguments['--compare']) as old_file:
+            compare(results, json.load(old_file)['results'])
+    else:
+        compare(results, {})
+    print('Results written to ' + output)
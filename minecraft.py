@@ -13,16 +13,18 @@
 """System V init script for the Minecraft server.
 
 Usage:
-  minecraft [options] start | stop | backup | status | restart
-  minecraft [options] update [snapshot <snapshot-id> | VERSION]
-  minecraft [options] command COMMAND...
+  minecraft [options] [--instance=<instance>]... (start | stop | backup | status | restart)
+  minecraft [options] [--instance=<instance>] update [snapshot <snapshot-id> | VERSION]
+  minecraft [options] [--instance=<instance>] command COMMAND...
   minecraft -h | --help
   minecraft --version
 
 Options:
-  -h, --help         Print this message and exit.
-  --config=<config>  Path to the config file [default: /opt/wurstmineberg/config/init-minecraft.json].
-  --version          Print version info and exit.
+  -a, --all-instances        Run start, stop, backup, status or restart for the main server and all instances from the config file, in parallel.
+  -h, --help                 Print this message and exit.
+  -i, --instance=<instance>  Use the named instance from the config file instead of the main server. May be given multiple times to start, stop, back up etc. several instances in parallel.
+  --config=<config>          Path to the config file [default: /opt/wurstmineberg/config/init-minecraft.json].
+  --version                  Print version info and exit.
 """
 
 import sys
@@ -31,18 +33,14 @@ sys.path.append('/opt/py')
 
 from datetime import date
 from datetime import datetime
-from docopt import docopt
 from datetime import time as dtime
+import contextlib
 import errno
-import gzip
 import json
-import loops
-import more_itertools
 import os
 import os.path
 import pwd
 import re
-import requests
 import socket
 import subprocess
 import time
@@ -71,23 +69,36 @@ def parse_version_string():
     except:
         pass
 
-__version__ = str(parse_version_string())
+def __getattr__(name):
+    # resolve __version__ on first access only, so commands like status don't pay for the git calls
+    if name == '__version__':
+        global __version__
+        __version__ = str(parse_version_string())
+        return __version__
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
 
 CONFIG_FILE = '/opt/wurstmineberg/config/init-minecraft.json'
 user_not_found_error = '[!!!!] User wurstmineberg not found. You need to create this user and give them access to the server directory.'
 
 if __name__ == '__main__':
-    arguments = docopt(__doc__, version='Minecraft init script ' + __version__)
+    from docopt import docopt
+
+    arguments = docopt(__doc__)
+    if arguments['--version']:
+        print('Minecraft init script ' + str(parse_version_string()))
+        sys.exit()
     CONFIG_FILE = arguments['--config']
 
-def config(key=None, default_value=None):
+def config(key=None, default_value=None, instance=None):
     """Get the item with the given key from the config file.
 
     Optional arguments:
     key -- the key from the config dict to return. If not present or None, the entire config will be returned.
     default_value -- If the specified key is not present in the config file, this argument is returned. If not present of None, a pre-set default is returned instead.
+    instance -- The name of a server instance from the "instances" section of the config file. The instance's settings are merged over the top-level ones, so each instance should at least set its own paths.server, paths.socket and world. Defaults to None, meaning the main server.
     """
     default_config = {
+        'instances': {},
         'java_options': {
             'cpu_count': 1,
             'jar_options': ['nogui'],
@@ -126,10 +137,95 @@ def config(key=None, default_value=None):
             j = json.load(config_file)
     except:
         j = default_config
+    if instance is not None:
+        instances = j.get('instances', default_config['instances'])
+        if instance not in instances:
+            raise ValueError('No such instance: ' + str(instance))
+        j = dict(j)
+        for instance_key, value in instances[instance].items():
+            base = j.get(instance_key, default_config.get(instance_key))
+            if isinstance(value, dict) and isinstance(base, dict):
+                j[instance_key] = dict(base, **value)
+            else:
+                j[instance_key] = value
+    if key is None or key == 'paths':
+        # pgrep alone can't tell instances running the same jar apart, so each instance has its own pidfile unless it sets one itself
+        j['paths'] = dict(j.get('paths', default_config['paths']))
+        if 'pidfile' not in j['paths'] or (instance is not None and 'pidfile' not in instances[instance].get('paths', {})):
+            j['paths']['pidfile'] = os.path.join(j['paths'].get('server', default_config['paths']['server']), 'minecraft.pid')
     if key is None:
         return j
     return j.get(key, default_config.get(key)) if default_value is None else j.get(key, default_value)
 
+class LogBroadcast:
+    """Follows the server log in a single asyncio task and distributes the lines to any number of subscribers, so the log is only read once.
+
+    Usage:
+        broadcast = LogBroadcast()
+        async for timestamp, prefix, message in broadcast.subscribe():
+            ...
+
+    Each subscriber receives the lines logged after it subscribed. The follower task is started by the first subscriber and runs until stop is called. If reading the log fails, the exception is raised in all subscribers, and the next subscriber starts a new follower task.
+
+    Optional arguments:
+    error_log -- a file-like object where any error messages and tracebacks are directed. Defaults to None, meaning no error logging.
+    instance -- The name of the server instance whose logs are read. Defaults to None, meaning the main server.
+    poll_interval -- How often to check for new lines, in seconds. With inotify, this is only a fallback. Defaults to 1.
+    """
+    def __init__(self, error_log=None, instance=None, poll_interval=1):
+        self.error_log = error_log
+        self.instance = instance
+        self.poll_interval = poll_interval
+        self.queues = set()
+        self.task = None
+
+    async def _follow(self):
+        import asyncio
+
+        end = None # end of the log
+        try:
+            async for line in log_async(error_log=self.error_log, instance=self.instance, poll_interval=self.poll_interval, history=False):
+                for queue in self.queues:
+                    queue.put_nowait(line)
+        except asyncio.CancelledError:
+            raise # stopped, not an error (CancelledError is an Exception before Python 3.8)
+        except Exception as e:
+            end = e # raised in the subscribers instead
+        finally:
+            for queue in self.queues:
+                queue.put_nowait(end)
+
+    def start(self):
+        """Start the follower task if it isn't running, or has stopped because of an error. Must be called from a coroutine."""
+        import asyncio
+
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self._follow())
+
+    def stop(self):
+        """Stop the follower task. All subscriptions end."""
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def subscribe(self):
+        """Generate the lines logged from now on, as triples like those generated by log."""
+        import asyncio
+
+        queue = asyncio.Queue()
+        self.queues.add(queue)
+        self.start()
+        try:
+            while True:
+                line = await queue.get()
+                if line is None:
+                    return
+                if isinstance(line, Exception):
+                    raise line
+                yield line
+        finally:
+            self.queues.discard(queue)
+
 class MinecraftServerNotRunningError(Exception):
     pass
 
@@ -162,6 +258,7 @@ def _command_output(cmd, args=[]):
     return out.decode('utf-8')
 
 def _download(url, local_filename=None): #FROM http://stackoverflow.com/a/16696317/667338
+    import requests
     if local_filename is None:
         local_filename = url.split('#')[0].split('?')[0].split('/')[-1]
         if local_filename == '':
@@ -190,53 +287,295 @@ def _fork(func, *args, **kwargs):
         pid = os.fork() 
         if pid > 0:
             # exit from second parent
-            sys.exit(0) 
+            os._exit(os.EX_OK)
     except OSError as e: 
         print('fork #2 failed: %d (%s)' % (e.errno, e.strerror), file=sys.stderr)
         sys.exit(1)
     with open(os.path.devnull) as devnull:
         sys.stdin = devnull
         sys.stdout = devnull
-        func(*args, **kwargs) # do stuff
-        os._exit(os.EX_OK) # all done
+        try:
+            func(*args, **kwargs) # do stuff
+        except:
+            import traceback
+
+            traceback.print_exc(file=sys.stderr)
+            sys.stderr.flush()
+        finally:
+            os._exit(os.EX_OK) # all done
+
+def _follow_lines(path, from_end=False, f=None):
+    # yields (line, file name, modification time) triples from the file at path, and None whenever there is nothing new yet
+    # if the file is rotated, the rest of the old file is read before continuing with the new one
+    # if from_end is true, the lines which are already in the file are skipped
+    # f can be the file at path, already opened in binary mode by the caller
+    import gzip
+
+    while True:
+        if f is None:
+            try:
+                f = open(path, 'rb')
+            except FileNotFoundError:
+                from_end = False
+                yield None
+                continue
+        with f:
+            first_line = None
+            partial = b''
+            if from_end:
+                first_line = f.readline()
+                if first_line.endswith(b'\n'):
+                    # continue after the last complete line
+                    size = os.fstat(f.fileno()).st_size
+                    f.seek(max(0, size - 65536))
+                    tail = f.read()
+                    f.seek(size - len(tail) + tail.rfind(b'\n') + 1)
+                else:
+                    first_line = None
+                    f.seek(0)
+                from_end = False
+            while True:
+                for line in iter(f.readline, b''):
+                    partial += line
+                    if partial.endswith(b'\n'):
+                        if first_line is None:
+                            first_line = partial
+                        yield partial.decode('utf-8'), path, os.fstat(f.fileno()).st_mtime
+                        partial = b''
+                try:
+                    current = os.stat(path)
+                except FileNotFoundError:
+                    yield None # the file has been moved away and its replacement doesn't exist yet, so keep reading the old one
+                    continue
+                if current.st_ino != os.fstat(f.fileno()).st_ino:
+                    # moved away and replaced, nothing more will be written to the old file once the new one exists
+                    for line in iter(f.readline, b''):
+                        partial += line
+                        if partial.endswith(b'\n'):
+                            yield partial.decode('utf-8'), path, os.fstat(f.fileno()).st_mtime
+                            partial = b''
+                    if partial:
+                        yield partial.decode('utf-8'), path, os.fstat(f.fileno()).st_mtime
+                    break
+                if current.st_size < f.tell():
+                    # copied and truncated in place, so the lines we haven't read yet are in the archived copy
+                    offset = f.tell() - len(partial)
+                    log_dir = os.path.dirname(path)
+                    for archive_name in sorted(os.listdir(log_dir), reverse=True):
+                        archive_path = os.path.join(log_dir, archive_name)
+                        if archive_path == path or not archive_name.endswith(('.log', '.log.gz')):
+                            continue
+                        with (gzip.open if archive_name.endswith('.gz') else open)(archive_path, 'rb') as archive:
+                            if first_line is None or archive.readline() != first_line:
+                                continue
+                            archive.seek(offset)
+                            for line in archive:
+                                yield line.decode('utf-8'), archive_path, os.path.getmtime(archive_path)
+                        break
+                    break
+                yield None
+        f = None
 
-def backup(announce=False, reply=print, path=None):
+def _inotify(directory):
+    # returns an inotify_simple.INotify watching the directory for changes, or None if inotify is not available
+    try:
+        import inotify_simple
+    except ImportError:
+        return None
+    inotify = inotify_simple.INotify()
+    flags = inotify_simple.flags
+    try:
+        inotify.add_watch(directory, flags.MODIFY | flags.CREATE | flags.DELETE | flags.MOVED_FROM | flags.MOVED_TO)
+    except OSError:
+        inotify.close()
+        return None
+    return inotify
+
+def _log(reverse=False, error_log=None, instance=None, follow=False, history=True):
+    # generates the lines for log and log_async, and None when following and there are no new lines yet
+    import gzip
+
+    server_dir = config('paths', instance=instance)['server']
+    tzinfo = timezone(timedelta(hours=config('utc_offset', instance=instance)))
+    latest_log = os.path.join(server_dir, 'logs', 'latest.log')
+    latest_file = None
+    if follow:
+        # opened before the archives are listed, so no lines are lost if latest.log is rotated while the history is read
+        try:
+            latest_file = open(latest_log, 'rb')
+        except FileNotFoundError:
+            pass
+    try:
+        if reverse:
+            log_files = [os.path.join(server_dir, 'logs', logfilename) for logfilename in sorted(os.listdir(os.path.join(server_dir, 'logs')), reverse=True)] + [os.path.join(server_dir, 'server.log')]
+        else:
+            log_files = [os.path.join(server_dir, 'server.log')] + [os.path.join(server_dir, 'logs', logfilename) for logfilename in sorted(os.listdir(os.path.join(server_dir, 'logs')))]
+        if follow:
+            log_files = [log_file_name for log_file_name in log_files if log_file_name != latest_log and history] # latest.log is read by _follow_lines instead
+            if latest_file is not None and log_files:
+                try:
+                    rotated = os.stat(latest_log).st_ino != os.fstat(latest_file.fileno()).st_ino
+                except FileNotFoundError:
+                    rotated = True
+                if rotated:
+                    # the archive of the open file may have been listed, but its lines are read from the open file
+                    first_line = latest_file.readline()
+                    latest_file.seek(0)
+                    for log_file_name in log_files:
+                        try:
+                            with (gzip.open if log_file_name.endswith('.gz') else open)(log_file_name, 'rb') as archive:
+                                if archive.readline() != first_line:
+                                    continue
+                        except (IOError, OSError):
+                            continue
+                        log_files.remove(log_file_name)
+                        break
+        for log_file_name in log_files:
+            if log_file_name.endswith('.log.gz'):
+                open_func = gzip.open
+            else:
+                open_func = open
+            try:
+                with open_func(log_file_name) as logfile:
+                    for line in (reversed(list(logfile)) if reverse else logfile):
+                        if not isinstance(line, str):
+                            line = line.decode('utf-8')
+                        yield _parse_log_line(line, log_file_name, tzinfo=tzinfo)
+            except GeneratorExit:
+                return
+            except:
+                if error_log is not None:
+                    import traceback
+
+                    print('DEBUG] Exception reading logs:', file=error_log)
+                    traceback.print_exc(file=error_log)
+        if follow:
+            # the lines only have a time of day, so the date is tracked across them like in update_sessions
+            log_date = None
+            last_time = None
+            if history and latest_file is not None:
+                times = [match.group(1) for match in (re.match(b'\\[([0-9]{2}:[0-9]{2}:[0-9]{2})\\]', line) for line in latest_file) if match]
+                log_date = _log_start_date(latest_log, [time_of_day.decode('ascii') for time_of_day in times], os.fstat(latest_file.fileno()).st_mtime, tzinfo)
+                latest_file.seek(0)
+            for line in _follow_lines(latest_log, from_end=not history, f=latest_file):
+                if line is None:
+                    yield None
+                    continue
+                match = re.match('\\[([0-9]{2}:[0-9]{2}:[0-9]{2})\\]', line[0])
+                if match:
+                    if log_date is None:
+                        log_date = _log_start_date(line[1], [match.group(1)], line[2], tzinfo)
+                    elif _log_rolled_over(last_time, match.group(1)):
+                        log_date = (datetime.strptime(log_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+                    last_time = match.group(1)
+                yield _parse_log_line(line[0], line[1], tzinfo=tzinfo, mtime=line[2], log_date=log_date)
+    finally:
+        if latest_file is not None:
+            latest_file.close()
+
+def _log_rolled_over(previous_time, current_time):
+    # the server keeps writing to the same log file past midnight, so a time of day going back by more than 12 hours means the next day has started
+    if previous_time is None:
+        return False
+    return datetime.strptime(previous_time, '%H:%M:%S') - datetime.strptime(current_time, '%H:%M:%S') > timedelta(hours=12)
+
+def _log_start_date(path, times, mtime, tzinfo):
+    # returns the date of the first of the times of day logged in the file at path as YYYY-MM-DD, or None if there are none
+    # archives are named after their date, otherwise the days are counted back from the modification time, when the last line was written
+    if re.match('[0-9]{4}-[0-9]{2}-[0-9]{2}', os.path.basename(path)):
+        return os.path.basename(path)[:10]
+    if len(times) == 0:
+        return None
+    modified = datetime.fromtimestamp(mtime, tzinfo)
+    end_date = modified.date() if times[-1] <= modified.strftime('%H:%M:%S') else modified.date() - timedelta(days=1)
+    return (end_date - timedelta(days=sum(_log_rolled_over(previous_time, current_time) for previous_time, current_time in zip(times, times[1:])))).strftime('%Y-%m-%d')
+
+def _parse_log_line(line, log_file_name, tzinfo=timezone.utc, mtime=None, log_date=None):
+    # returns the (timestamp, prefix, message) triple generated by log
+    # mtime can be given for files which may have been moved away since the line was read
+    # log_date can be given if the date of the line is already known, otherwise it's guessed from the file name or modification time
+    match = re.match('(' + regexes.timestamp + '|' + regexes.full_timestamp + ') ' + regexes.prefix + ' (.*)$', line)
+    if match:
+        if match.group(1).startswith('['):
+            if log_date is None:
+                log_date = datetime.fromtimestamp(os.path.getmtime(log_file_name) if mtime is None else mtime, tz=timezone(timedelta(seconds=-time.timezone))).date() # log file's last modified date
+                if re.match('\\d{4}-\\d{2}-\\d{2}', os.path.basename(log_file_name)[:10]):
+                    log_date = os.path.basename(log_file_name)[:10]
+            return regexes.strptime(log_date, match.group(1), tzinfo=tzinfo), match.group(2), match.group(3)
+        return datetime.strptime(match.group(1) + ' +0000', '%Y-%m-%d %H:%M:%S %z'), match.group(2), match.group(3)
+    return None, None, line.rstrip('\r\n')
+
+def _process_alive(pid):
+    # unlike Popen.poll, this also works in processes other than the parent
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    try:
+        with open('/proc/{}/stat'.format(pid)) as stat:
+            return stat.read().rsplit(')', 1)[1].split()[0] != 'Z' # a zombie has exited but hasn't been reaped by its parent yet
+    except (IOError, OSError):
+        return True
+
+def _sessions_db(instance=None):
+    import sqlite3
+
+    db = sqlite3.connect(os.path.join(config('paths', instance=instance)['log'], 'sessions.sqlite3' if instance is None else 'sessions_' + instance + '.sqlite3'))
+    if 'log_date' not in [column[1] for column in db.execute('PRAGMA table_info(offsets)')]:
+        # stores from before the date was tracked per log file may have misdated sessions, so they are rebuilt
+        db.executescript('DROP TABLE IF EXISTS offsets; DROP TABLE IF EXISTS sessions;')
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS sessions (player TEXT NOT NULL, start REAL NOT NULL, end REAL);
+        CREATE INDEX IF NOT EXISTS sessions_player_start ON sessions (player, start);
+        CREATE INDEX IF NOT EXISTS sessions_start ON sessions (start);
+        CREATE TABLE IF NOT EXISTS offsets (path TEXT PRIMARY KEY, offset INTEGER NOT NULL, first_line BLOB, log_date TEXT, last_time TEXT);
+    """) # timestamps are stored as seconds since the epoch, an end of NULL means the session is still ongoing
+    # log_date and last_time are the date and time of day of the last processed line, for log files whose lines only have a time of day
+    return db
+
+def backup(announce=False, reply=print, path=None, instance=None):
     """Back up the Minecraft world.
     
     Optional arguments:
     announce -- Whether to announce in-game that saves are being disabled/reenabled.
     reply -- This function is called with human-readable progress updates. Defaults to the built-in print function.
     path -- Where the backup will be saved. The file extension .tar.gz will be appended automatically. Defaults to a file with the world name and a timestamp in the backups directory.
+    instance -- The name of the server instance to back up. Defaults to None, meaning the main server.
     """
-    save_off(announce=announce, reply=reply)
+    paths = config('paths', instance=instance)
+    world = config('world', instance=instance)
+    save_off(announce=announce, reply=reply, instance=instance)
     if path is None:
         now = datetime.utcnow().strftime('%Y-%m-%d_%Hh%M')
-        path = os.path.join(config('paths')['backup'], config('world') + '_' + now)
+        path = os.path.join(paths['backup'], world + '_' + now)
     backup_file = path + '.tar'
     reply('Backing up minecraft world...')
-    subprocess.call(['tar', '-C', config('paths')['server'], '-cf', backup_file, config('world')])
-    subprocess.call(['rsync', '-av', '--delete', os.path.join(config('paths')['server'], config('world')) + '/', os.path.join(config('paths')['backup'], 'latest')])
-    save_on(announce=announce, reply=reply)
+    subprocess.call(['tar', '-C', paths['server'], '-cf', backup_file, world])
+    subprocess.call(['rsync', '-av', '--delete', os.path.join(paths['server'], world) + '/', os.path.join(paths['backup'], 'latest')])
+    save_on(announce=announce, reply=reply, instance=instance)
     reply('Compressing backup...')
     subprocess.call(['gzip', '-f', backup_file])
     backup_file += '.gz'
     reply('Symlinking to httpdocs...')
-    if os.path.lexists(config('paths')['backupweb']):
-        os.unlink(config('paths')['backupweb'])
-    os.symlink(backup_file, config('paths')['backupweb'])
+    if os.path.lexists(paths['backupweb']):
+        os.unlink(paths['backupweb'])
+    os.symlink(backup_file, paths['backupweb'])
     reply('Done.')
 
-def command(cmd, args=[], block=False, subst=True):
+def command(cmd, args=[], block=False, subst=True, instance=None):
     # raises socket.error if Minecraft is disconnected
     def file_len(file): #FROM http://stackoverflow.com/questions/845058/how-to-get-line-count-cheaply-in-python
         for i, l in enumerate(file):
             pass
         return i + 1
     
-    if (not block) and not status():
+    if (not block) and not status(instance=instance):
         return None
+    paths = config('paths', instance=instance)
     try:
-        with open(os.path.join(config('paths')['server'], 'logs', 'latest.log')) as logfile:
+        with open(os.path.join(paths['server'], 'logs', 'latest.log')) as logfile:
             pre_log_len = file_len(logfile)
     except (IOError, OSError):
         pre_log_len = 0
@@ -244,12 +583,12 @@ def command(cmd, args=[], block=False, subst=True):
         pre_log_len = None
     cmd += (' ' + ' '.join(str(arg) for arg in args)) if len(args) else ''
     with socket.socket(socket.AF_UNIX) as s:
-        s.connect(config('paths')['socket'])
+        s.connect(paths['socket'])
         s.sendall(cmd.encode('utf-8') + b'\n')
     if pre_log_len is None:
         return None
     time.sleep(0.2) # assumes that the command will run and print to the log file in less than .2 seconds
-    return _command_output('tail', ['-n', '+' + str(pre_log_len + 1), os.path.join(config('paths')['server'], 'logs', 'latest.log')])
+    return _command_output('tail', ['-n', '+' + str(pre_log_len + 1), os.path.join(paths['server'], 'logs', 'latest.log')])
 
 def enable_world(world_name, **kwargs):
     """Switch to a different server.properties file.
@@ -260,13 +599,15 @@ def enable_world(world_name, **kwargs):
     Keyword-only arguments:
     reply -- This function is called with human-readable progress updates. Defaults to the built-in print function.
     start_message -- This string will be passed to the start function when restarting with the new world.
+    instance -- The name of the server instance whose world is switched. Defaults to None, meaning the main server. To run several worlds at the same time, configure them as separate instances instead.
     """
     reply = kwargs.get('reply', print)
-    was_running = status()
+    instance = kwargs.get('instance')
+    was_running = status(instance=instance)
     if was_running:
         stop(**kwargs)
         for _ in range(6):
-            if status():
+            if status(instance=instance):
                 time.sleep(5)
                 continue
             else:
@@ -275,15 +616,16 @@ def enable_world(world_name, **kwargs):
             reply('Could not stop the server! World will not be switched.')
             return False
         reply('Server stopped. Switching world...')
-    os.unlink(os.path.join(config('paths')['server'], 'server.properties'))
-    os.symlink(os.path.join(config('paths')['server'], 'server.properties.' + world_name), os.path.join(config('paths')['server'], 'server.properties'))
+    server_dir = config('paths', instance=instance)['server']
+    os.unlink(os.path.join(server_dir, 'server.properties'))
+    os.symlink(os.path.join(server_dir, 'server.properties.' + world_name), os.path.join(server_dir, 'server.properties'))
     if was_running:
         kwargs['start_message'] = kwargs.get('start_message', 'World switched. Restarting...')
         return start(**kwargs)
     else:
         return True
 
-def iter_update(version=None, snapshot=False, reply=print, log_path=None):
+def iter_update(version=None, snapshot=False, reply=print, log_path=None, instance=None):
     """Download a different version of Minecraft and restart the server if it is running. Returns a generator where each iteration performs one step of the update process.
 
     Optional arguments:
@@ -291,7 +633,9 @@ def iter_update(version=None, snapshot=False, reply=print, log_path=None):
     snapshot -- If version is given, this specifies whether the version is a development version. If no version is given, this specifies whether the newest stable version or the newest development version should be downloaded. Defaults to False.
     reply -- This function is called several times with a string argument representing update progress. Defaults to the built-in print function.
     log_path -- This is passed to the stop function if the server is stopped before the update.
+    instance -- The name of the server instance to update. The new jar is downloaded to the shared jar directory. Defaults to None, meaning the main server.
     """
+    import requests
     versions_json = requests.get('https://s3.amazonaws.com/Minecraft.Download/versions/versions.json').json()
     if version is None: # try to dynamically get the latest version number from assets
         version = versions_json['latest']['snapshot' if snapshot else 'release']
@@ -317,14 +661,15 @@ def iter_update(version=None, snapshot=False, reply=print, log_path=None):
         os.makedirs(os.path.join(config('paths')['client_versions'], version), exist_ok=True)
         _download('https://s3.amazonaws.com/Minecraft.Download/versions/' + version + '/' + version + '.jar', local_filename=os.path.join(config('paths')['client_versions'], version, version + '.jar'))
     yield 'Download finished. Stopping server...'
-    say('Server will be upgrading to ' + version_text + ' and therefore restart')
+    say('Server will be upgrading to ' + version_text + ' and therefore restart', instance=instance)
     time.sleep(5)
-    was_running = status()
-    stop(reply=reply, log_path=log_path)
+    was_running = status(instance=instance)
+    stop(reply=reply, log_path=log_path, instance=instance)
     yield 'Server stopped. Installing new server...'
-    if os.path.lexists(config('paths')['service']):
-        os.unlink(config('paths')['service'])
-    os.symlink(os.path.join(config('paths')['jar'], 'minecraft_server.' + version + '.jar'), config('paths')['service'])
+    service = config('paths', instance=instance)['service']
+    if os.path.lexists(service):
+        os.unlink(service)
+    os.symlink(os.path.join(config('paths')['jar'], 'minecraft_server.' + version + '.jar'), service)
     if os.path.lexists(os.path.join(config('paths')['home'], 'home', 'client.jar')):
         os.unlink(os.path.join(config('paths')['home'], 'home', 'client.jar'))
     os.symlink(os.path.join(config('paths')['client_versions'], version, version + '.jar'), os.path.join(config('paths')['home'], 'home', 'client.jar'))
@@ -333,12 +678,12 @@ def iter_update(version=None, snapshot=False, reply=print, log_path=None):
     except Exception as e:
         reply('Error while updating mapcrafter textures: ' + str(e))
     if was_running:
-        start(reply=reply, start_message='Server updated. Restarting...')
+        start(reply=reply, start_message='Server updated. Restarting...', instance=instance)
     return
 
-def last_seen(player, logins_log=None):
+def last_seen(player, logins_log=None, instance=None):
     if logins_log is None:
-        for timestamp, _, logline in log(reverse=True):
+        for timestamp, _, logline in log(reverse=True, instance=instance):
             match = re.match(re.escape(player) + ' left the game', logline)
             if match and (timestamp is not None):
                 return timestamp
@@ -351,49 +696,104 @@ def last_seen(player, logins_log=None):
                 if match and match.group(2) == player:
                     return datetime.strptime(match.group(1) + ' +0000', '%Y-%m-%d %H:%M:%S %z')
 
-def log(reverse=False, error_log=None):
+def log(reverse=False, error_log=None, instance=None, follow=False, poll_interval=1, history=True):
     """Generate lines from all server logs. A line is a triple of the timestamp (an aware datetime object), the prefix (info like the log level, depends on how old the log is), and the log message.
     
     Optional arguments:
     reverse -- Causes the log lines to be generated from newest to oldest instead of chronologically. Defaults to False.
     error_log -- a file-like object where any error messages and tracebacks are directed. Defaults to None, meaning no error logging.
+    instance -- The name of the server instance whose logs are read. Defaults to None, meaning the main server.
+    follow -- If true, the generator doesn't stop after the last line but blocks until new lines are logged, following latest.log across log rotation. Can't be combined with reverse. Uses inotify if inotify_simple is installed, polling otherwise. Defaults to False.
+    poll_interval -- How often to check for new lines in follow mode, in seconds. With inotify, this is only a fallback. Defaults to 1.
+    history -- If false, only lines logged from now on are generated. Requires follow. Defaults to True.
     """
-    if reverse:
-        log_files = [os.path.join(config('paths')['server'], 'logs', logfilename) for logfilename in sorted(os.listdir(os.path.join(config('paths')['server'], 'logs')), reverse=True)] + [os.path.join(config('paths')['server'], 'server.log')]
-    else:
-        log_files = [os.path.join(config('paths')['server'], 'server.log')] + [os.path.join(config('paths')['server'], 'logs', logfilename) for logfilename in sorted(os.listdir(os.path.join(config('paths')['server'], 'logs')))]
-    for log_file_name in log_files:
-        if log_file_name.endswith('.log.gz'):
-            open_func = gzip.open
-        else:
-            open_func = open
+    if follow and reverse:
+        raise ValueError('The log cannot be followed in reverse')
+    if not (follow or history):
+        raise ValueError('history=False requires follow=True')
+    inotify = _inotify(os.path.join(config('paths', instance=instance)['server'], 'logs')) if follow else None
+    try:
+        for line in _log(reverse=reverse, error_log=error_log, instance=instance, follow=follow, history=history):
+            if line is not None:
+                yield line
+            elif inotify is None:
+                time.sleep(poll_interval)
+            else:
+                inotify.read(timeout=int(poll_interval * 1000))
+    finally:
+        if inotify is not None:
+            inotify.close()
+
+async def log_async(error_log=None, instance=None, poll_interval=1, history=True):
+    """Asynchronous version of log(follow=True), for use with asyncio. The log files are read in the default executor and waiting for new lines doesn't block the event loop either. To distribute the lines to many consumers, use a LogBroadcast.
+
+    Optional arguments:
+    error_log -- a file-like object where any error messages and tracebacks are directed. Defaults to None, meaning no error logging.
+    instance -- The name of the server instance whose logs are read. Defaults to None, meaning the main server.
+    poll_interval -- How often to check for new lines, in seconds. With inotify, this is only a fallback. Defaults to 1.
+    history -- If false, only lines logged from now on are generated. Defaults to True.
+    """
+    import asyncio
+
+    chunk_size = 1000
+    loop = asyncio.get_running_loop()
+    inotify = _inotify(os.path.join(config('paths', instance=instance)['server'], 'logs'))
+    lines = _log(error_log=error_log, instance=instance, follow=True, history=history)
+
+    def read_chunk():
+        # reads lines until there are no new ones or the chunk is full
+        chunk = []
+        for line in lines:
+            if line is None:
+                break
+            chunk.append(line)
+            if len(chunk) >= chunk_size:
+                break
+        return chunk
+
+    try:
+        while True:
+            chunk = await loop.run_in_executor(None, read_chunk)
+            for line in chunk:
+                yield line
+            if len(chunk) >= chunk_size:
+                continue # there may be more lines
+            elif inotify is None:
+                await asyncio.sleep(poll_interval)
+            else:
+                changed = loop.create_future()
+                loop.add_reader(inotify.fileno(), lambda: changed.done() or changed.set_result(None))
+                try:
+                    await asyncio.wait_for(changed, poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    loop.remove_reader(inotify.fileno())
+                inotify.read(timeout=0) # discard the events
+    finally:
         try:
-            with open_func(log_file_name) as logfile:
-                for line in (reversed(list(logfile)) if reverse else logfile):
-                    if not isinstance(line, str):
-                        line = line.decode('utf-8')
-                    match = re.match('(' + regexes.timestamp + '|' + regexes.full_timestamp + ') ' + regexes.prefix + ' (.*)$', line)
-                    if match:
-                        if match.group(1).startswith('['):
-                            log_date = datetime.fromtimestamp(os.path.getmtime(log_file_name), tz=timezone(timedelta(seconds=-time.timezone))).date() # log file's last modified date
-                            if re.match('\\d{4}-\\d{2}-\\d{2}', log_file_name[:10]):
-                                log_date = log_file_name[:10]
-                            yield regexes.strptime(log_date, match.group(1), tzinfo=timezone(timedelta(hours=config('utc_offset')))), match.group(2), match.group(3)
-                        else:
-                            yield datetime.strptime(match.group(1) + ' +0000', '%Y-%m-%d %H:%M:%S %z') , match.group(2), match.group(3)
-                    else:
-                        yield None, None, line.rstrip('\r\n')
-        except GeneratorExit:
-            raise StopIteration
-        except:
-            if error_log is not None:
-                print('DEBUG] Exception reading logs:', file=error_log)
-                traceback.print_exc(file=error_log)
+            lines.close()
+        except ValueError:
+            pass # still running in the executor after being cancelled, it will be closed when garbage collected
+        if inotify is not None:
+            inotify.close()
+
+def online_at(timestamp, instance=None):
+    """Return a sorted list of the players who were online at the given time, according to the session store. See update_sessions.
 
-def online_players(retry=True, allow_exceptions=False):
+    Required arguments:
+    timestamp -- An aware datetime object.
+
+    Optional arguments:
+    instance -- The name of the server instance. Defaults to None, meaning the main server.
+    """
+    with contextlib.closing(_sessions_db(instance=instance)) as db:
+        return [player for player, in db.execute('SELECT DISTINCT player FROM sessions WHERE start <= ? AND (end IS NULL OR end > ?) ORDER BY player', (timestamp.timestamp(), timestamp.timestamp()))]
+
+def online_players(retry=True, allow_exceptions=False, instance=None):
     found = False
     try:
-        list = command('list')
+        list = command('list', instance=instance)
     except socket.error:
         if allow_exceptions:
             raise
@@ -402,7 +802,7 @@ def online_players(retry=True, allow_exceptions=False):
         if allow_exceptions:
             raise ValueError('list is None')
         if retry:
-            return online_players(retry=False)
+            return online_players(retry=False, instance=instance)
         return []
     for line in list.splitlines():
         if found:
@@ -414,14 +814,58 @@ def online_players(retry=True, allow_exceptions=False):
     if allow_exceptions:
         raise ValueError('no player list found')
     if retry:
-        return online_players(retry=False)
+        return online_players(retry=False, instance=instance)
     return []
 
+def player_sessions(player=None, start=None, end=None, instance=None):
+    """Return a chronological list of play sessions from the session store, see update_sessions. A session is a triple of the player name, the join time, and the leave time (aware datetime objects). The leave time is None if the session is still ongoing.
+
+    Optional arguments:
+    player -- If given, only this player's sessions are returned.
+    start -- An aware datetime object. If given, only sessions which end after this time are returned.
+    end -- An aware datetime object. If given, only sessions which start before this time are returned.
+    instance -- The name of the server instance. Defaults to None, meaning the main server.
+    """
+    query = 'SELECT player, start, end FROM sessions WHERE 1'
+    params = []
+    if player is not None:
+        query += ' AND player = ?'
+        params.append(player)
+    if start is not None:
+        query += ' AND (end IS NULL OR end > ?)'
+        params.append(start.timestamp())
+    if end is not None:
+        query += ' AND start < ?'
+        params.append(end.timestamp())
+    with contextlib.closing(_sessions_db(instance=instance)) as db:
+        return [(session_player, datetime.fromtimestamp(session_start, timezone.utc), None if session_end is None else datetime.fromtimestamp(session_end, timezone.utc)) for session_player, session_start, session_end in db.execute(query + ' ORDER BY start', params)]
+
+def playtime(player=None, start=None, end=None, instance=None):
+    """Return a dict mapping player names to their total playtime as timedelta objects, according to the session store. See update_sessions.
+
+    Optional arguments:
+    player -- If given, only this player's playtime is returned.
+    start -- An aware datetime object. If given, only playtime after this time is counted.
+    end -- An aware datetime object. If given, only playtime before this time is counted. Ongoing sessions are counted up to this time, or up to now if no end is given.
+    instance -- The name of the server instance. Defaults to None, meaning the main server.
+    """
+    end_timestamp = (datetime.now(timezone.utc) if end is None else end).timestamp()
+    query = 'SELECT player, SUM(MIN(COALESCE(end, :end), :end) - MAX(start, :start)) FROM sessions WHERE start < :end AND (end IS NULL OR end > :start)'
+    params = {
+        'end': end_timestamp,
+        'start': float('-inf') if start is None else start.timestamp()
+    }
+    if player is not None:
+        query += ' AND player = :player'
+        params['player'] = player
+    with contextlib.closing(_sessions_db(instance=instance)) as db:
+        return {session_player: timedelta(seconds=total) for session_player, total in db.execute(query + ' GROUP BY player', params)}
+
 def restart(*args, **kwargs):
     reply = kwargs.get('reply', print)
     stop(*args, **kwargs)
     for _ in range(6):
-        if status():
+        if status(instance=kwargs.get('instance')):
             time.sleep(5)
             continue
         else:
@@ -432,52 +876,57 @@ def restart(*args, **kwargs):
     kwargs['start_message'] = kwargs.get('start_message', 'Server stopped. Restarting...')
     return start(*args, **kwargs)
 
-def save_off(announce=True, reply=print):
+def save_off(announce=True, reply=print, instance=None):
     """Turn off automatic world saves, then force-save once.
     
     Optional arguments:
     announce -- Whether to announce in-game that saves are being disabled.
     reply -- This function is called with human-readable progress updates. Defaults to the built-in print function.
+    instance -- The name of the server instance. Defaults to None, meaning the main server.
     """
-    if status():
+    if status(instance=instance):
         reply('Minecraft is running... suspending saves')
         if announce:
-            say('Server backup starting. Server going readonly...')
-        command('save-off')
-        command('save-all')
+            say('Server backup starting. Server going readonly...', instance=instance)
+        command('save-off', instance=instance)
+        command('save-all', instance=instance)
         subprocess.call(['sync'])
         time.sleep(10)
     else:
         reply('Minecraft is not running. Not suspending saves.')
 
-def save_on(announce=True, reply=print):
+def save_on(announce=True, reply=print, instance=None):
     """Enable automatic world saves.
     
     Optional arguments:
     announce -- Whether to announce in-game that saves are being enabled.
     reply -- This function is called with human-readable progress updates. Defaults to the built-in print function.
+    instance -- The name of the server instance. Defaults to None, meaning the main server.
     """
-    if status():
+    if status(instance=instance):
         reply('Minecraft is running... re-enabling saves')
-        command('save-on')
+        command('save-on', instance=instance)
         if announce:
-            say('Server backup ended. Server going readwrite...')
+            say('Server backup ended. Server going readwrite...', instance=instance)
     else:
         reply('Minecraft is not running. Not resuming saves.')
 
-def say(message, prefix=True):
+def say(message, prefix=True, instance=None):
     if prefix:
-        command('say', [message])
+        command('say', [message], instance=instance)
     else:
-        tellraw(message)
+        tellraw(message, instance=instance)
 
 def start(*args, **kwargs):
+    import loops
+    import more_itertools
+
     def feed_commands(java_popen):
         loopvar = True
         with socket.socket(socket.AF_UNIX) as s:
-            if os.path.exists(config('paths')['socket']):
-                os.remove(config('paths')['socket'])
-            s.bind(config('paths')['socket'])
+            if os.path.exists(paths['socket']):
+                os.remove(paths['socket'])
+            s.bind(paths['socket'])
             while loopvar:
                 str_buffer = ''
                 s.listen(1)
@@ -492,63 +941,88 @@ def start(*args, **kwargs):
                             loopvar = False
                             break
                         java_popen.stdin.write(line.encode('utf-8') + b'\n')
+                        java_popen.stdin.flush()
                     str_buffer = lines[-1]
                 c.close()
-                if java_popen.poll() is not None:
+                if not _process_alive(java_popen.pid): # java_popen.poll() doesn't work here since this process isn't java's parent
                     return
         java_popen.communicate(input=b'stop\n')
-        if os.path.exists(config('paths')['socket']):
-            os.remove(config('paths')['socket'])
+        if os.path.exists(paths['socket']):
+            os.remove(paths['socket'])
+        if os.path.exists(paths['pidfile']):
+            os.remove(paths['pidfile'])
     
-    invocation = ['java', '-Xmx' + str(config('java_options')['max_heap']) + 'M', '-Xms' + str(config('java_options')['min_heap']) + 'M', '-XX:+UseConcMarkSweepGC', '-XX:+CMSIncrementalMode', '-XX:+CMSIncrementalPacing', '-XX:ParallelGCThreads=' + str(config('java_options')['cpu_count']), '-XX:+AggressiveOpts', '-Dlog4j.configurationFile=' + config('paths')['logConfig'], '-jar', config('paths')['service']] + config('java_options')['jar_options']
+    instance = kwargs.get('instance')
+    paths = config('paths', instance=instance)
+    java_options = config('java_options', instance=instance)
+    invocation = ['java', '-Xmx' + str(java_options['max_heap']) + 'M', '-Xms' + str(java_options['min_heap']) + 'M', '-XX:+UseConcMarkSweepGC', '-XX:+CMSIncrementalMode', '-XX:+CMSIncrementalPacing', '-XX:ParallelGCThreads=' + str(java_options['cpu_count']), '-XX:+AggressiveOpts', '-Dlog4j.configurationFile=' + paths['logConfig'], '-jar', paths['service']] + java_options['jar_options']
     reply = kwargs.get('reply', print)
-    if status():
+    if status(instance=instance):
         reply('Server is already running!')
         return False
     reply(kwargs.get('start_message', 'starting Minecraft server...'))
-    java_popen = subprocess.Popen(invocation, stdin=subprocess.PIPE, stdout=subprocess.PIPE, cwd=config('paths')['server']) # start the java process
-    for line in loops.timeout_total(java_popen.stdout, timedelta(seconds=config('startTimeout'))): # wait until the timeout has been exceeded...
-        if re.match(regexes.full_timestamp + ' [Server thread/INFO]: Done \\([0-9]+.[0-9]+s\\)!', line.decode('utf-8')): # ...or the server has finished starting
+    java_popen = subprocess.Popen(invocation, stdin=subprocess.PIPE, stdout=subprocess.PIPE, cwd=paths['server']) # start the java process
+    with open(paths['pidfile'], 'w') as pidfile:
+        print(java_popen.pid, file=pidfile)
+    for line in loops.timeout_total(java_popen.stdout, timedelta(seconds=config('startTimeout', instance=instance))): # wait until the timeout has been exceeded...
+        if re.match('(' + regexes.timestamp + '|' + regexes.full_timestamp + ') \\[Server thread/INFO\\]: Done \\([0-9]+.[0-9]+s\\)!', line.decode('utf-8')): # ...or the server has finished starting
             break
     _fork(feed_commands, java_popen) # feed commands from the socket to java
     _fork(more_itertools.consume, java_popen.stdout) # consume java stdout to prevent deadlocking
     if kwargs.get('log_path'):
         with open(kwargs['log_path'], 'a') as loginslog:
-            ver = version()
+            ver = version(instance=instance)
             print(datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S') + (' @restart' if ver is None else ' @start ' + ver), file=loginslog) # logs in UTC
-    return status()
+    return status(instance=instance)
 
-def status():
-    pwd.getpwnam('wurstmineberg') # raises KeyError when user ‘wurstmineberg’ doesn't exist
+def status(instance=None):
+    username = config('username', instance=instance)
+    pwd.getpwnam(username) # raises KeyError when the user (by default ‘wurstmineberg’) doesn't exist
+    pgrep = ['pgrep', '-u', username, '-f', config('service_name', instance=instance)]
+    pidfile = config('paths', instance=instance)['pidfile']
+    if instance is not None or os.path.exists(pidfile):
+        pgrep[1:1] = ['-F', pidfile] # only match the process started for this instance
+        with open(os.devnull, 'a') as devnull:
+            return not subprocess.call(pgrep, stdout=devnull, stderr=devnull)
+    # the main server may have been started by a version of this script that didn't write a pidfile, so match any process except the instances'
+    instance_pids = set()
+    for instance_name in config('instances'):
+        try:
+            with open(config('paths', instance=instance_name)['pidfile']) as instance_pidfile:
+                instance_pids.add(int(instance_pidfile.read().strip()))
+        except (IOError, OSError, ValueError):
+            pass
     with open(os.devnull, 'a') as devnull:
-        return not subprocess.call(['pgrep', '-u', 'wurstmineberg', '-f', config('service_name')], stdout=devnull)
+        pids = subprocess.Popen(pgrep, stdout=subprocess.PIPE, stderr=devnull).communicate()[0].decode('utf-8').split()
+    return any(int(pid) not in instance_pids for pid in pids)
 
 def stop(*args, **kwargs):
     reply = kwargs.get('reply', print)
-    if status():
+    instance = kwargs.get('instance')
+    if status(instance=instance):
         reply('SERVER SHUTTING DOWN IN 10 SECONDS. Saving map...')
         notice = kwargs.get('notice', 'SERVER SHUTTING DOWN IN 10 SECONDS. Saving map...')
         if notice is not None:
-            say(str(notice))
-        command('save-all')
+            say(str(notice), instance=instance)
+        command('save-all', instance=instance)
         time.sleep(10)
-        command('stop')
+        command('stop', instance=instance)
         time.sleep(7)
         if kwargs.get('log_path'):
             with open(kwargs['log_path'], 'a') as loginslog:
                 print(datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S') + ' @stop', file=loginslog) # logs in UTC
     else:
         reply('Minecraft server was not running.')
-    return not status()
+    return not status(instance=instance)
 
-def tellraw(message_dict, player='@a'):
+def tellraw(message_dict, player='@a', instance=None):
     if isinstance(message_dict, str):
         message_dict = {'text': message_dict}
     elif isinstance(message_dict, list):
         message_dict = {'text': '', 'extra': message_dict}
-    command('tellraw', [player, json.dumps(message_dict)])
+    command('tellraw', [player, json.dumps(message_dict)], instance=instance)
 
-def update(version=None, snapshot=False, reply=print, log_path=None):
+def update(version=None, snapshot=False, reply=print, log_path=None, instance=None):
     """Download a different version of Minecraft and restart the server if it is running.
     
     Optional arguments:
@@ -556,23 +1030,108 @@ def update(version=None, snapshot=False, reply=print, log_path=None):
     snapshot -- If version is given, this specifies whether the version is a development version. If no version is given, this specifies whether the newest stable version or the newest development version should be downloaded. Defaults to False.
     reply -- This function is called several times with a string argument representing update progress. Defaults to the built-in print function.
     log_path -- This is passed to the stop function if the server is stopped before the update.
+    instance -- The name of the server instance to update. The new jar is downloaded to the shared jar directory. Defaults to None, meaning the main server.
     """
-    update_iterator = iter_update(version=version, snapshot=snapshot, reply=reply, log_path=log_path)
+    update_iterator = iter_update(version=version, snapshot=snapshot, reply=reply, log_path=log_path, instance=instance)
     version_dict = next(update_iterator)
     reply('Downloading ' + version_dict['version_text'])
     for message in update_iterator:
         reply(message)
     return version_dict['version'], version_dict['is_snapshot'], version_dict['version_text']
 
-def update_whitelist(people_file=None):
+def update_sessions(logins_log=None, instance=None):
+    """Add the joins and leaves logged since the last call to the session store, an SQLite database in the log directory. Only the parts of the log files that have not been processed yet are read, so this is cheap to call before each query. Returns the number of events processed.
+
+    Optional arguments:
+    logins_log -- The path to the logins log passed to start and stop as log_path. If given, the @start, @stop and @restart markers in it end all sessions that are still ongoing at that time.
+    instance -- The name of the server instance. Defaults to None, meaning the main server.
+    """
+    import gzip
+
+    def new_lines(db, path, open_func=open, rotated_from=None):
+        # returns the complete lines that haven't been processed yet as (line, date) pairs and records the new offset
+        with open_func(path, 'rb') as f:
+            first_line = f.readline()
+            row = db.execute('SELECT offset, first_line, log_date, last_time FROM offsets WHERE path = ?', (path if rotated_from is None else rotated_from,)).fetchone()
+            if row is not None and row[1] == first_line:
+                offset, _, log_date, last_time = row
+            else:
+                offset, log_date, last_time = 0, None, None # new or rotated file
+            f.seek(offset)
+            lines = []
+            for line in f:
+                if open_func is open and not line.endswith(b'\n'):
+                    break # still being written
+                offset += len(line)
+                lines.append(line.decode('utf-8'))
+            mtime = os.fstat(f.fileno()).st_mtime
+        times = [match.group(1) for match in (re.match('\\[([0-9]{2}:[0-9]{2}:[0-9]{2})\\]', line) for line in lines) if match]
+        if log_date is None:
+            log_date = _log_start_date(path, times, mtime, tzinfo)
+        result = []
+        for line in lines:
+            match = re.match('\\[([0-9]{2}:[0-9]{2}:[0-9]{2})\\]', line)
+            if match:
+                if _log_rolled_over(last_time, match.group(1)):
+                    log_date = (datetime.strptime(log_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+                last_time = match.group(1)
+            result.append((line, log_date))
+        db.execute('INSERT OR REPLACE INTO offsets (path, offset, first_line, log_date, last_time) VALUES (?, ?, ?, ?, ?)', (path, offset, first_line, log_date, last_time))
+        return result
+
+    def end_all(db, timestamp):
+        db.execute('UPDATE sessions SET end = ? WHERE end IS NULL AND start <= ?', (timestamp, timestamp))
+
+    server_dir = config('paths', instance=instance)['server']
+    tzinfo = timezone(timedelta(hours=config('utc_offset', instance=instance)))
+    latest_log = os.path.join(server_dir, 'logs', 'latest.log')
+    log_files = [(os.path.join(server_dir, 'server.log'), open)]
+    with contextlib.closing(_sessions_db(instance=instance)) as db, db:
+        processed = {path for path, in db.execute('SELECT path FROM offsets')}
+        for log_file_name in sorted(os.listdir(os.path.join(server_dir, 'logs'))):
+            log_file_name = os.path.join(server_dir, 'logs', log_file_name)
+            if log_file_name.endswith('.log.gz') and log_file_name not in processed: # rotated logs don't change
+                log_files.append((log_file_name, gzip.open))
+        log_files.append((latest_log, open))
+        events = []
+        for log_file_name, open_func in log_files:
+            if not os.path.exists(log_file_name):
+                continue
+            # a new archive may be the old latest.log, in which case processing resumes at latest.log's offset
+            for line, log_date in new_lines(db, log_file_name, open_func, rotated_from=latest_log if open_func is gzip.open else None):
+                timestamp, _, message = _parse_log_line(line, log_file_name, tzinfo=tzinfo, log_date=log_date)
+                if timestamp is None:
+                    continue
+                match = re.match('(' + regexes.player + ') (joined|left) the game$', message)
+                if match:
+                    events.append((timestamp.timestamp(), match.group(2), match.group(1)))
+                elif message.startswith('Starting minecraft server') or message.startswith('Stopping server'):
+                    events.append((timestamp.timestamp(), 'end_all', None))
+        if logins_log is not None and os.path.exists(logins_log):
+            for line, _ in new_lines(db, logins_log):
+                match = re.match('(' + regexes.full_timestamp + ') @(start|stop|restart)', line)
+                if match:
+                    events.append((datetime.strptime(match.group(1) + ' +0000', '%Y-%m-%d %H:%M:%S %z').timestamp(), 'end_all', None))
+        for timestamp, event, player in sorted(events, key=lambda event: event[0]):
+            if event == 'joined':
+                if db.execute('SELECT 1 FROM sessions WHERE player = ? AND end IS NULL', (player,)).fetchone() is None:
+                    db.execute('INSERT INTO sessions (player, start) VALUES (?, ?)', (player, timestamp))
+            elif event == 'left':
+                db.execute('UPDATE sessions SET end = ? WHERE player = ? AND end IS NULL AND start <= ?', (timestamp, player, timestamp))
+            else:
+                end_all(db, timestamp)
+    return len(events)
+
+def update_whitelist(people_file=None, instance=None):
     import lazyjson
     # get wanted whitelist from people file
     if people_file is None:
         people_file = config('paths')['people']
+    server_dir = config('paths', instance=instance)['server']
     whitelist = []
     by_name = []
-    additional = config('whitelist').get('additional', [])
-    if not config('whitelist').get('ignore_people', False):
+    additional = config('whitelist', instance=instance).get('additional', [])
+    if not config('whitelist', instance=instance).get('ignore_people', False):
         with open(people_file) as people_fobj:
             people = json.load(people_fobj)
             if isinstance(people, dict):
@@ -593,7 +1152,7 @@ def update_whitelist(people_file=None):
                 else:
                     by_name.append(person['minecraft'])
     # write old whitelist
-    old_whitelist_path = os.path.join(config('paths')['server'], 'white-list.txt')
+    old_whitelist_path = os.path.join(server_dir, 'white-list.txt')
     with open(old_whitelist_path, 'a'):
         os.utime(old_whitelist_path, None) # touch the file
     with open(old_whitelist_path, 'w') as whitelistfile:
@@ -614,19 +1173,19 @@ def update_whitelist(people_file=None):
             for minecraft_nick in additional:
                 print(minecraft_nick, file=whitelistfile)
     # write new whitelist
-    new_whitelist_path = os.path.join(config('paths')['server'], 'whitelist.json')
+    new_whitelist_path = os.path.join(server_dir, 'whitelist.json')
     with open(new_whitelist_path, 'a'):
         os.utime(new_whitelist_path, None) # touch the file
     with open(new_whitelist_path, 'w') as whitelist_json:
         json.dump(whitelist, whitelist_json, sort_keys=True, indent=4, separators=(',', ': '))
     # apply changes to whitelist files
-    command('whitelist', ['reload'])
+    command('whitelist', ['reload'], instance=instance)
     # add people with unknown UUIDs to new whitelist using the command
     for name in by_name + additional:
-        command('whitelist', ['add', name])
+        command('whitelist', ['add', name], instance=instance)
     # update people file
     try:
-        with open(os.path.join(config('paths')['server'], 'whitelist.json')) as whitelist_json:
+        with open(os.path.join(server_dir, 'whitelist.json')) as whitelist_json:
             whitelist = json.load(whitelist_json)
     except ValueError:
         return
@@ -643,13 +1202,13 @@ def update_whitelist(people_file=None):
             elif person.get('minecraft') == whitelist_entry['name'] and 'minecraftUUID' not in person:
                 person['minecraftUUID'] = whitelist_entry['uuid']
 
-def version():
-    for _, _, line in log(reverse=True):
+def version(instance=None):
+    for _, _, line in log(reverse=True, instance=instance):
         match = re.match('Starting minecraft server version (.*)', line)
         if match:
             return match.group(1)
 
-def whitelist_add(id, minecraft_nick=None, minecraft_uuid=None, people_file='/opt/wurstmineberg/config/people.json', person_status='postfreeze', invited_by=None):
+def whitelist_add(id, minecraft_nick=None, minecraft_uuid=None, people_file='/opt/wurstmineberg/config/people.json', person_status='postfreeze', invited_by=None, instance=None):
     """Add a new person to people.json and reload the whitelist.
     
     Required arguments:
@@ -661,6 +1220,7 @@ def whitelist_add(id, minecraft_nick=None, minecraft_uuid=None, people_file='/op
     people_file -- The path to people.json. Defaults to /opt/wurstmineberg/config/people.json
     person_status -- This will be added to the people.json entry as the value of the "status" field, determining whether or not the person will be on the whitelist. Defaults to postfreeze.
     invited_by -- The person who invited the new person. May be a Wurstmineberg ID or a wurstminebot.nicksub.Person object. If given, the inviting person will be noted in the invitee's people.json entry.
+    instance -- The name of the server instance whose whitelist is reloaded. Defaults to None, meaning the main server.
     """
     with open(people_file) as f:
         people = json.load(f)
@@ -702,66 +1262,93 @@ def whitelist_add(id, minecraft_nick=None, minecraft_uuid=None, people_file='/op
         people.append(new_person)
     with open(people_file, 'w') as people_fobj:
         json.dump({'people': people}, people_fobj, sort_keys=True, indent=4, separators=(',', ': '))
-    update_whitelist(people_file=people_file)
+    update_whitelist(people_file=people_file, instance=instance)
 
 def wiki_version_link(version):
     version = version[0].upper() + version[1:]
     return 'http://minecraft.gamepedia.com/' + urllib.parse.quote(re.sub(' ', '_', version))
 
-if __name__ == '__main__':
+def _lifecycle_cli(arguments, instance=None):
+    # runs start, stop, restart, backup or status for one instance from the command line and returns the exit status
+    name = 'minecraft' if instance is None else 'minecraft instance ' + instance
+    if instance is None:
+        reply = print
+    else:
+        reply = lambda message: print('[' + instance + '] ' + str(message))
     if arguments['start']:
         try:
-            if start():
-                print('[ ok ] minecraft is now running.')
+            if start(reply=reply, instance=instance):
+                print('[ ok ] ' + name + ' is now running.')
             else:
-                print('[FAIL] Error! Could not start minecraft.')
+                print('[FAIL] Error! Could not start ' + name + '.')
         except KeyError:
             sys.exit(user_not_found_error)
     elif arguments['stop']:
         try:
-            if stop():
-                print('[ ok ] minecraft is stopped.')
+            if stop(reply=reply, instance=instance):
+                print('[ ok ] ' + name + ' is stopped.')
             else:
-                print('[FAIL] Error! minecraft could not be stopped.')
+                print('[FAIL] Error! ' + name + ' could not be stopped.')
         except KeyError:
             sys.exit(user_not_found_error)
     elif arguments['restart']:
         try:
-            if restart():
-                print('[ ok ] minecraft is new running.')
+            if restart(reply=reply, instance=instance):
+                print('[ ok ] ' + name + ' is new running.')
             else:
-                print('[FAIL] Error! Could not start minecraft.')
+                print('[FAIL] Error! Could not start ' + name + '.')
         except KeyError:
             sys.exit(user_not_found_error)
-    elif arguments['update']:
-        try:
-            status()
-        except KeyError:
-            sys.exit(user_not_found_error)
-        if arguments['snapshot']:
-            update(arguments['<snapshot-id>'], snapshot=True)
-        elif arguments['VERSION']:
-            update(arguments['<snapshot-id>'])
-        else:
-            update(snapshot=True)
     elif arguments['backup']:
         try:
-            backup()
+            backup(reply=reply, instance=instance)
         except KeyError:
             sys.exit(user_not_found_error)
     elif arguments['status']:
         try:
-            s = status()
+            s = status(instance=instance)
         except KeyError:
             sys.exit(user_not_found_error)
         else:
-            print('[info] minecraft is ' + ('running.' if s else 'not running.'))
+            print('[info] ' + name + ' is ' + ('running.' if s else 'not running.'))
             if not s:
-                sys.exit(1)
+                return 1
+    return 0
+
+if __name__ == '__main__':
+    if arguments['--all-instances']:
+        instances = [None] + sorted(config('instances'))
+    else:
+        instances = arguments['--instance'] or [None]
+    for instance in instances:
+        if instance is not None and instance not in config('instances'):
+            sys.exit('[!!!!] No such instance: ' + instance)
+    if arguments['update']:
+        if len(instances) > 1:
+            sys.exit('[!!!!] Only one instance can be updated at a time.')
+        try:
+            status(instance=instances[0])
+        except KeyError:
+            sys.exit(user_not_found_error)
+        if arguments['snapshot']:
+            update(arguments['<snapshot-id>'], snapshot=True, instance=instances[0])
+        elif arguments['VERSION']:
+            update(arguments['<snapshot-id>'], instance=instances[0])
+        else:
+            update(snapshot=True, instance=instances[0])
     elif arguments['command']:
+        if len(instances) > 1:
+            sys.exit('[!!!!] Commands can only be sent to one instance at a time.')
         try:
-            cmdlog = command(arguments['COMMAND'][0], arguments['COMMAND'][1:])
+            cmdlog = command(arguments['COMMAND'][0], arguments['COMMAND'][1:], instance=instances[0])
         except KeyError:
             sys.exit(user_not_found_error)
         for line in cmdlog.splitlines():
             print(str(line))
+    elif len(instances) == 1:
+        sys.exit(_lifecycle_cli(arguments, instances[0]))
+    else:
+        # run each instance in its own process, since start forks and forking a multi-threaded process isn't safe
+        action = next(action for action in ('start', 'stop', 'backup', 'status', 'restart') if arguments[action])
+        instance_popens = [subprocess.Popen([sys.executable, os.path.abspath(__file__), '--config=' + CONFIG_FILE] + ([] if instance is None else ['--instance=' + instance]) + [action]) for instance in instances]
+        sys.exit(max(instance_popen.wait() for instance_popen in instance_popens))